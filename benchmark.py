@@ -0,0 +1,882 @@
+#!/usr/bin/env python3
+##############################################################################
+#                                                                            #
+#   Bulk Mail - A bulk mail / mail merge system using Python 3               #
+#   Copyright (C) 2019, 2024 Bob Swift (rdswift)                             #
+#                                                                            #
+#   This program is free software: you can redistribute it and/or modify     #
+#   it under the terms of the GNU General Public License as published by     #
+#   the Free Software Foundation, either version 3 of the License, or        #
+#   (at your option) any later version.                                      #
+#                                                                            #
+#   This program is distributed in the hope that it will be useful,          #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of           #
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the            #
+#   GNU General Public License for more details.                             #
+#                                                                            #
+#   You should have received a copy of the GNU General Public License        #
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.   #
+#                                                                            #
+##############################################################################
+"""
+Throughput benchmark for Bulk Mail.  Sends synthetic messages through the
+Bulk Mail render and send code to a local SMTP sink, and reports the number
+of messages per second and the per-message latency.
+"""
+
+import argparse
+import asyncio
+import collections
+import json
+import os
+import shutil
+import ssl
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+
+import bulkmail
+
+
+DASH_LINE = '-' * 79
+
+WORDS = (
+    'lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor incididunt ut labore '
+    'et dolore magna aliqua enim ad minim veniam quis nostrud exercitation ullamco laboris nisi aliquip '
+    'ex ea commodo consequat duis aute irure in reprehenderit voluptate velit esse cillum eu fugiat'
+).split()
+
+
+############################################
+#   Local SMTP server that discards mail   #
+############################################
+
+class SinkProtocol(asyncio.Protocol):
+    """Connection to the SMTP sink.  Supports the PIPELINING, STARTTLS and AUTH extensions.
+
+    All of the commands received together are processed as a group, and the replies are sent
+    together after the configured latency, which simulates the network round trip to a
+    remote mail server.
+
+    The sink records the envelope senders, the order that recipients are received, and the
+    number of messages in progress to each recipient domain.  If throttling is enabled, recipients beyond the limit
+    for their domain are refused with a temporary (451) reply, as a busy mail server would.  If
+    a limit on the messages per connection is set, the commands after the limit are answered
+    with a 421 reply and the connection is closed, as a mail server shutting down would.
+    """
+
+    def __init__(self, sink):
+        """Initialize the connection.
+
+        Arguments:
+            sink {SmtpSink} -- the server that accepted the connection
+        """
+        self.sink = sink
+        self.transport = None
+        self.buffer = bytearray()
+        self.in_data = False
+        self.auth_lines = 0
+        self.tls = False
+        self.paused = False
+        self.upgrade = False
+        self.closing = False
+        self.count = 0
+        self.domains = []
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.sink.connections += 1
+        self.sink.connection_times.append(self.sink.loop.time())
+        if self.sink.failing:
+            self.paused = True
+            self.transport.write(b'421 4.3.2 Service not available\r\n')
+            self.transport.close()
+            return
+        self.reply([b'220 localhost Bulk Mail benchmark sink\r\n'])
+
+    def data_received(self, data):
+        self.buffer += data
+        self.process()
+
+    def process(self):
+        """Process all of the complete commands and message data received.
+        """
+        replies = []
+        while not self.paused:
+            if self.in_data:
+                end = self.buffer.find(b'\r\n.\r\n')
+                if end < 0:
+                    break
+                if self.sink.keep:
+                    self.sink.data.append(bytes(self.buffer[2:end + 2]))
+                del self.buffer[:end + 5]
+                self.in_data = False
+                self.release()
+                self.count += 1
+                self.sink.messages += 1
+                self.sink.message_bytes += end - 2
+                replies.append(b'250 2.0.0 Ok: queued\r\n')
+                continue
+            end = self.buffer.find(b'\r\n')
+            if end < 0:
+                break
+            line = bytes(self.buffer[:end]).decode('UTF-8', 'replace')
+            del self.buffer[:end + 2]
+            replies.append(self.command(line))
+            if self.in_data:
+                # The message data begins after the CRLF that ends the DATA command
+                self.buffer[0:0] = b'\r\n'
+            elif self.upgrade:
+                asyncio.ensure_future(self.starttls(replies))
+                return
+        if replies:
+            self.reply(replies)
+
+    def command(self, line):
+        """Process a single command line.
+
+        Arguments:
+            line {str} -- the command received
+
+        Returns:
+            bytes -- the reply to the command
+        """
+        if self.closing:
+            return b'421 4.3.2 Service shutting down\r\n'
+        if self.auth_lines:
+            self.auth_lines -= 1
+            return b'334 UGFzc3dvcmQ6\r\n' if self.auth_lines else b'235 2.7.0 Authentication successful\r\n'
+        verb = line[:4].upper()
+        if verb == 'EHLO':
+            extensions = [b'localhost', b'PIPELINING', b'8BITMIME']
+            if not self.tls and self.sink.context is not None:
+                extensions.append(b'STARTTLS')
+            if self.sink.auth:
+                extensions.append(b'AUTH PLAIN LOGIN')
+            if self.sink.utf8:
+                extensions.append(b'SMTPUTF8')
+            return b''.join(b'250-' + extension + b'\r\n' for extension in extensions[:-1]) + b'250 ' + extensions[-1] + b'\r\n'
+        if verb == 'AUTH':
+            parts = line.split()
+            if len(parts) > 1 and parts[1].upper() == 'LOGIN':
+                self.auth_lines = 2
+                return b'334 VXNlcm5hbWU6\r\n'
+            if len(parts) < 3:
+                self.auth_lines = 1
+                return b'334 \r\n'
+            return b'235 2.7.0 Authentication successful\r\n'
+        if verb == 'STAR' and self.sink.context is not None:
+            self.paused = True
+            self.upgrade = True
+            return b'220 2.0.0 Ready to start TLS\r\n'
+        if verb == 'DATA':
+            if not self.domains:
+                return b'554 5.5.1 No valid recipients\r\n'
+            self.in_data = True
+            return b'354 End data with <CR><LF>.<CR><LF>\r\n'
+        if verb == 'QUIT':
+            self.paused = True
+            self.release()
+            self.sink.loop.call_later(self.sink.latency, self.transport.close)
+            return b'221 2.0.0 Bye\r\n'
+        if verb == 'MAIL' and self.sink.closing and self.count >= self.sink.closing:
+            self.closing = True
+            return b'421 4.3.2 Service shutting down\r\n'
+        if verb == 'MAIL':
+            self.sink.senders[(line.partition(':')[2].split() or [''])[0]] += 1
+        if verb == 'RCPT':
+            return self.recipient(line)
+        if verb == 'RSET':
+            self.release()
+        if verb in ('HELO', 'MAIL', 'RSET', 'NOOP'):
+            return b'250 2.0.0 Ok\r\n'
+        return b'500 5.5.2 Command not recognized\r\n'
+
+    def recipient(self, line):
+        """Accept a recipient unless its domain is over the throttle limit.
+
+        Arguments:
+            line {str} -- the RCPT command received
+
+        Returns:
+            bytes -- the reply to the command
+        """
+        domain = line.rpartition('@')[2].strip(' >').lower()
+        if not self.sink.accept(domain):
+            return b'451 4.7.1 Too many messages to this domain, try again later\r\n'
+        self.domains.append(domain)
+        inflight = self.sink.inflight.get(domain, 0) + 1
+        self.sink.inflight[domain] = inflight
+        self.sink.max_inflight[domain] = max(self.sink.max_inflight.get(domain, 0), inflight)
+        return b'250 2.1.5 Ok\r\n'
+
+    def release(self):
+        """End the transaction in progress, if any.
+        """
+        for domain in self.domains:
+            self.sink.inflight[domain] -= 1
+        self.domains = []
+
+    def reply(self, replies):
+        """Send the replies after the configured latency.
+
+        Arguments:
+            replies {list} -- the replies to send
+        """
+        data = b''.join(replies)
+        if self.closing:
+            # Nothing more is read once the connection is closing
+            self.paused = True
+            self.release()
+        if self.sink.latency:
+            self.sink.loop.call_later(self.sink.latency, self.send, data, self.closing)
+        else:
+            self.send(data, self.closing)
+
+    def send(self, data, close=False):
+        """Send data to the client.
+
+        Arguments:
+            data {bytes} -- the data to send
+
+        Keyword Arguments:
+            close {bool} -- close the connection after sending the data (default: False)
+        """
+        self.transport.write(data)
+        if close:
+            self.transport.close()
+
+    async def starttls(self, replies):
+        """Send the replies up to the STARTTLS command and then upgrade the connection.
+
+        Arguments:
+            replies {list} -- the replies to send
+        """
+        # Anything sent before the TLS handshake is discarded
+        self.buffer.clear()
+        if self.sink.latency:
+            await asyncio.sleep(self.sink.latency)
+        self.transport.write(b''.join(replies))
+        self.transport = await self.sink.loop.start_tls(self.transport, self, self.sink.context, server_side=True)
+        self.tls = True
+        self.upgrade = False
+        self.paused = False
+        self.process()
+
+    def connection_lost(self, exc):
+        self.paused = True
+        self.release()
+
+
+class SmtpSink():
+    """Local SMTP server running on a background thread that accepts and discards all mail.
+    """
+
+    def __init__(self, context, latency=0.0, auth=True, failing=False, throttle=None, keep=False, utf8=True, closing=0):
+        """Initialize the sink.  The server is not started until start() is called.
+
+        Arguments:
+            context {ssl.SSLContext} -- the server context used for STARTTLS, or None to not offer STARTTLS
+
+        Keyword Arguments:
+            latency {float} -- the number of seconds to wait before replying to each group of commands (default: 0.0)
+            auth {bool} -- offer the AUTH extension (default: True)
+            failing {bool} -- refuse every connection with a 421 reply, to stand in for a relay that is down (default: False)
+            throttle {tuple} -- the number of recipients accepted for each domain in any period of the number of seconds, or None for no limit (default: None)
+            keep {bool} -- keep the data of each message received, rather than discarding it (default: False)
+            utf8 {bool} -- offer the SMTPUTF8 extension (default: True)
+            closing {int} -- the number of messages accepted on each connection before closing it with a 421 reply, 0 for no limit (default: 0)
+        """
+        self.context = context
+        self.latency = latency
+        self.auth = auth
+        self.failing = failing
+        self.throttle = throttle
+        self.keep = keep
+        self.utf8 = utf8
+        self.closing = closing
+        self.data = []
+        self.port = None
+        self.loop = None
+        self.connections = 0
+        self.connection_times = []
+        self.messages = 0
+        self.message_bytes = 0
+        self.throttled = 0
+        self.received = []
+        self.senders = collections.Counter()
+        self.inflight = {}
+        self.max_inflight = {}
+        self._recent = {}
+        self._server = None
+        self._thread = None
+
+    def start(self):
+        """Start the server on an unused port on the local host.
+
+        Returns:
+            int -- the port number that the server is listening on
+        """
+        ready = threading.Event()
+
+        def run():
+            self.loop = asyncio.new_event_loop()
+            self._server = self.loop.run_until_complete(
+                self.loop.create_server(lambda: SinkProtocol(self), '127.0.0.1', 0)
+            )
+            self.port = self._server.sockets[0].getsockname()[1]
+            ready.set()
+            self.loop.run_forever()
+            self._server.close()
+            self.loop.run_until_complete(self._server.wait_closed())
+            self.loop.close()
+
+        self._thread = threading.Thread(target=run, name='smtp-sink', daemon=True)
+        self._thread.start()
+        ready.wait()
+        return self.port
+
+    def stop(self):
+        """Stop the server.
+        """
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+
+    def reset(self):
+        """Reset the connection and message counts.
+        """
+        self.connections = 0
+        self.connection_times = []
+        self.messages = 0
+        self.message_bytes = 0
+        self.throttled = 0
+        self.received = []
+        self.senders = collections.Counter()
+        self.data = []
+        self.max_inflight = {}
+        self._recent = {}
+
+    def accept(self, domain):
+        """Check the throttle limit for a recipient domain, and record the recipient if accepted.
+
+        Arguments:
+            domain {str} -- the domain of the recipient
+
+        Returns:
+            bool -- False if the recipient is refused by the throttle limit
+        """
+        now = self.loop.time()
+        if self.throttle is not None:
+            (count, period) = self.throttle
+            recent = self._recent.setdefault(domain, collections.deque())
+            while recent and now - recent[0] >= period:
+                recent.popleft()
+            if len(recent) >= count:
+                self.throttled += 1
+                return False
+            recent.append(now)
+        self.received.append((domain, now))
+        return True
+
+
+def create_tls_context(directory, cert_file=None, key_file=None):
+    """Create the server context used by the sink for STARTTLS.  A temporary self-signed
+    certificate is created using openssl if no certificate is provided.
+
+    Arguments:
+        directory {str} -- the directory used for the temporary certificate
+
+    Keyword Arguments:
+        cert_file {str} -- the certificate file to use (default: None)
+        key_file {str} -- the private key file to use (default: None)
+
+    Returns:
+        ssl.SSLContext -- the server context
+    """
+    if not cert_file:
+        cert_file = os.path.join(directory, 'cert.pem')
+        key_file = os.path.join(directory, 'key.pem')
+        subprocess.run(
+            ['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1', '-subj', '/CN=localhost',
+             '-keyout', key_file, '-out', cert_file],
+            check=True,
+            capture_output=True,
+        )
+    context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+    context.load_cert_chain(cert_file, key_file)
+    return context
+
+
+##################################
+#   Generate the test campaign   #
+##################################
+
+def write_address_file(filename, count, domains, sort=False):
+    """Write an address file with synthetic recipients spread across a number of domains.
+
+    Arguments:
+        filename {str} -- the file to write
+        count {int} -- the number of recipients
+        domains {int} -- the number of recipient domains
+
+    Keyword Arguments:
+        sort {bool} -- sort the recipients by domain rather than taking the domains in turn (default: False)
+    """
+    with open(filename, 'w', encoding='UTF-8', newline='') as f:
+        f.write('user_id,first_name,last_name,email\r\n')
+        for i in range(count):
+            domain = i * domains // count if sort else i % domains
+            f.write(f"u{i},First{i},Last{i},user{i}@domain{domain}.example.com\r\n")
+
+
+def write_message_file(filename, size):
+    """Write a markdown message with replaceable parameters, links and lists, padded with
+    paragraphs of text to approximately the requested size.
+
+    Arguments:
+        filename {str} -- the file to write
+        size {int} -- the approximate size of the message in bytes
+    """
+    lines = [
+        '# Bulk Mail benchmark message',
+        '',
+        'Dear {first_name} {last_name},',
+        '',
+        'This message was sent to **{email}** as part of a [benchmark](https://rdswift.github.io/bulkmail/).',
+        '',
+    ]
+    length = sum(len(line) + 1 for line in lines)
+    paragraph = 0
+    while length < size:
+        paragraph += 1
+        words = [WORDS[(paragraph * 7 + i) % len(WORDS)] for i in range(60)]
+        if paragraph % 3 == 0:
+            text = f"- {' '.join(words[:20])}\n- {' '.join(words[20:40])}\n- *{' '.join(words[40:])}*"
+        else:
+            text = f"{' '.join(words[:30])} [{words[30]}](https://example.com/{paragraph}) {' '.join(words[31:])}."
+        lines.extend([text, ''])
+        length += len(text) + 2
+    lines.append('Regards, and thanks {first_name}.')
+    with open(filename, 'w', encoding='UTF-8') as f:
+        f.write('\n'.join(lines) + '\n')
+
+
+class Campaign():
+    """Message templates and recipients prepared the same way as the Bulk Mail send command.
+    """
+
+    def __init__(self, addr_file, message_file, per_recipient=False, attachments=()):
+        """Read and compile the address and message files.
+
+        Arguments:
+            addr_file {str} -- the address file
+            message_file {str} -- the markdown message file
+
+        Keyword Arguments:
+            per_recipient {bool} -- convert the markdown for each recipient (default: False)
+            attachments {list} -- the bulkmail.Attachment files to include in each message (default: ())
+        """
+        self.addr_file = addr_file
+        self.attachments = attachments
+        with open(message_file, 'r', encoding='UTF-8') as f:
+            text = f.read()
+        matches = bulkmail.RE_SUBJ_GET.match(text)
+        self.subject = bulkmail.RE_HEADERS.sub('', matches.group(0).strip())
+        markdown = bulkmail.RE_SUBJ_DEL.sub('', text)
+        (text, html) = bulkmail.convert_markdown(markdown)
+        (rows, self.addr_fields) = bulkmail.parse_address_file(addr_file)
+        rows.close()
+        self.addr_template = bulkmail.Template(bulkmail.Settings.ADDRESS_TEMPLATE, self.addr_fields)
+        self.body = bulkmail.MessageBody(
+            text, html, self.addr_fields, markdown if per_recipient else None, bulkmail.Settings.MARKDOWN_CACHE_SIZE
+        )
+
+    def assembler(self):
+        """Create the message skeleton.
+
+        Returns:
+            bulkmail.MessageAssembler -- the message skeleton
+        """
+        return bulkmail.MessageAssembler(self.subject, not bulkmail.Settings.NO_FOOTER, self.attachments)
+
+    def messages(self):
+        """Read the address file and render the message for each recipient.
+
+        Returns:
+            generator -- the To: address, plain text body and HTML body of each message
+        """
+        (rows, addr_fields) = bulkmail.parse_address_file(self.addr_file)
+        for address_line in rows:
+            yield (self.addr_template.render(address_line),) + self.body.render(address_line)
+
+
+####################################
+#   Measure the send performance   #
+####################################
+
+class TimedScheduler(bulkmail.DomainScheduler):
+    """Scheduler that records the time that each message is taken to be sent.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.started = {}
+
+    def get(self, wait=True):
+        job = super().get(wait)
+        if job:
+            self.started[job.msg_to] = time.perf_counter()
+        return job
+
+
+class TimedEngine(bulkmail.SendEngine):
+    """Send engine that records the time from when each message is taken to be sent until the
+    result is received from the mail server.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.latencies = []
+
+    def _report(self, msg_to, failed, error=None):
+        started = self.scheduler.started.pop(msg_to, None)
+        if started is not None:
+            self.latencies.append(time.perf_counter() - started)
+        super()._report(msg_to, failed, error)
+
+
+def percentile(values, fraction):
+    """Calculate a percentile of the values.
+
+    Arguments:
+        values {list} -- the sorted values
+        fraction {float} -- the percentile as a fraction (e.g. 0.95)
+
+    Returns:
+        float -- the percentile value, or 0.0 if there are no values
+    """
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def bench_render(campaign):
+    """Render and assemble every message without sending.
+
+    Arguments:
+        campaign {Campaign} -- the campaign to render
+
+    Returns:
+        dict -- the number of messages, bytes and messages per second
+    """
+    assembler = campaign.assembler()
+    count = 0
+    size = 0
+    start = time.perf_counter()
+    for (msg_to, msg_text, msg_html) in campaign.messages():
+        size += sum(len(segment) for segment in assembler.build(msg_to, msg_text, msg_html))
+        count += 1
+    elapsed = time.perf_counter() - start
+    return {
+        'messages': count,
+        'message_bytes': size // max(1, count),
+        'seconds': round(elapsed, 4),
+        'rate': round(count / elapsed, 1) if elapsed else 0.0,
+    }
+
+
+def bench_send(campaign, sinks, connections):
+    """Send every message to the sinks through the Bulk Mail send engine, using each sink as a
+    relay.
+
+    Arguments:
+        campaign {Campaign} -- the campaign to send
+        sinks {list} -- the servers receiving the messages
+        connections {int} -- the number of concurrent connections to each sink
+
+    Returns:
+        dict -- the message counts, messages per second and latency percentiles
+    """
+    for sink in sinks:
+        sink.reset()
+    scheduler = TimedScheduler(
+        bulkmail.Settings.SCHEDULE_WINDOW,
+        bulkmail.Settings.DOMAIN_CONCURRENCY,
+        bulkmail.Settings.DOMAIN_RATE_MINUTE / 60,
+        bulkmail.Settings.DOMAIN_RATE_BURST,
+    )
+    engine = TimedEngine(connections, campaign.assembler(), None, bulkmail.RateLimiter.fromSettings(), None, scheduler)
+    start = time.perf_counter()
+    engine.start()
+    for (msg_to, msg_text, msg_html) in campaign.messages():
+        if not engine.submit(msg_to, msg_text, msg_html):
+            break
+    (count, count_err) = engine.finish()
+    elapsed = time.perf_counter() - start
+    latencies = sorted(engine.latencies)
+    return {
+        'messages': count,
+        'failures': count_err,
+        'received': sum(sink.messages for sink in sinks),
+        'throttled': sum(sink.throttled for sink in sinks),
+        'connections': sum(sink.connections for sink in sinks),
+        'seconds': round(elapsed, 4),
+        'rate': round(count / elapsed, 1) if elapsed else 0.0,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+        'mean_ms': round(statistics.fmean(latencies) * 1000, 2) if latencies else 0.0,
+        'error': None if engine.error is None else str(engine.error),
+    }
+
+
+################################################################################
+
+def parse_command_line():
+    """Parse the command line arguments.
+
+    Returns:
+        argparse.Namespace -- the command line arguments
+    """
+    arg_parser = argparse.ArgumentParser(
+        description="Measure the Bulk Mail render and send throughput against a local SMTP sink.",
+    )
+    arg_parser.add_argument(
+        "--recipients",
+        help="Number of recipients in the synthetic address file.  Defaults to 2000.",
+        type=int,
+        default=2000,
+        metavar='NUM',
+    )
+    arg_parser.add_argument(
+        "--domains",
+        help="Number of recipient domains in the synthetic address file.  Defaults to 20.",
+        type=int,
+        default=20,
+        metavar='NUM',
+    )
+    arg_parser.add_argument(
+        "--sizes",
+        help="Comma separated list of approximate message sizes in kilobytes.  Defaults to 2,20,200.",
+        default='2,20,200',
+        metavar='LIST',
+    )
+    arg_parser.add_argument(
+        "--connections",
+        help="Comma separated list of the numbers of concurrent mail server connections to test.  Defaults to 1,4.",
+        default='1,4',
+        metavar='LIST',
+    )
+    arg_parser.add_argument(
+        "--latency",
+        help="Number of milliseconds the sink waits before replying to each group of commands.  Defaults to 5.",
+        type=float,
+        default=5.0,
+        metavar='MS',
+    )
+    arg_parser.add_argument(
+        "--relays",
+        help="Number of sinks to send through as separate relays.  Defaults to 1.",
+        type=int,
+        default=1,
+        metavar='NUM',
+    )
+    arg_parser.add_argument(
+        "--failing-relays",
+        help="Number of additional relays that refuse every connection.  Defaults to 0.",
+        type=int,
+        default=0,
+        metavar='NUM',
+    )
+    arg_parser.add_argument(
+        "--throttle",
+        help="Make the sinks refuse recipients with a temporary error beyond NUM per SECONDS for each domain.  (e.g.: 10/60)",
+        metavar='NUM/SECONDS',
+    )
+    arg_parser.add_argument(
+        "--no-pipelining",
+        help="Don't use command pipelining.",
+        action='store_true',
+    )
+    arg_parser.add_argument(
+        "--no-auth",
+        help="Don't log in to the sink.",
+        action='store_true',
+    )
+    arg_parser.add_argument(
+        "--domain-concurrency",
+        help="Maximum number of messages in progress to the same recipient domain.  0=no limit",
+        type=int,
+        default=0,
+        metavar='NUM',
+    )
+    arg_parser.add_argument(
+        "--domain-rate",
+        help="Maximum number of messages to send per minute to the same recipient domain.  0=no limit",
+        type=float,
+        default=0.0,
+        metavar='NUM',
+    )
+    arg_parser.add_argument(
+        "--skip-send",
+        help="Only measure the render and assemble time.",
+        action='store_true',
+    )
+    arg_parser.add_argument(
+        "--no-tls",
+        help="Don't offer STARTTLS from the sink.  Bulk Mail stops with an error for a mail server without TLS.",
+        action='store_true',
+    )
+    arg_parser.add_argument(
+        "--tls-cert",
+        help="Certificate file for the sink.  A temporary self-signed certificate is created using openssl if not specified.",
+        metavar='FILE',
+    )
+    arg_parser.add_argument(
+        "--tls-key",
+        help="Private key file for the sink certificate.",
+        metavar='FILE',
+    )
+    arg_parser.add_argument(
+        "--attach",
+        help="A file to attach to each message.  Use the option more than once to attach more than one file.",
+        metavar='FILE',
+        action='append',
+        default=[],
+    )
+    arg_parser.add_argument(
+        "--markdown-per-recipient",
+        help="Convert the markdown message for each recipient.",
+        action='store_true',
+    )
+    arg_parser.add_argument(
+        "--output",
+        help="Write the results to a file in JSON format.",
+        metavar='FILE',
+    )
+    arg_parser.add_argument(
+        "--baseline",
+        help="Compare the results with a previous results file written using --output.",
+        metavar='FILE',
+    )
+    return arg_parser.parse_args()
+
+
+def change(value, baseline, higher_is_better=True):
+    """Format the change in a value from its baseline as a percentage.
+
+    Arguments:
+        value {float} -- the current value
+        baseline {float} -- the baseline value
+
+    Keyword Arguments:
+        higher_is_better {bool} -- show an increase as an improvement (default: True)
+
+    Returns:
+        str -- the percentage change, flagged with '!' if it is a regression of more than 5%
+    """
+    if not baseline:
+        return ''
+    pct = (value - baseline) * 100 / baseline
+    worse = pct < -5 if higher_is_better else pct > 5
+    return f"{pct:+.1f}%{'!' if worse else ''}"
+
+
+def main():
+    """Main processing.
+    """
+    args = parse_command_line()
+    sizes = [float(size) for size in args.sizes.split(',')]
+    connection_counts = [int(count) for count in args.connections.split(',')]
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='UTF-8') as f:
+            baseline = {(r['size_kb'], r['connections']): r for r in json.load(f)['results']}
+
+    settings = bulkmail.Settings
+    settings.MAIL_FROM_ADDR = 'Bulk Mail Benchmark <benchmark@example.com>'
+    settings.ADDRESS_TEMPLATE = '{first_name} {last_name} <{email}>'
+    settings.MAIL_WAIT = 0.0
+    settings.MAIL_PIPELINING = not args.no_pipelining
+    settings.DOMAIN_CONCURRENCY = args.domain_concurrency
+    settings.DOMAIN_RATE_MINUTE = args.domain_rate
+    settings.DISPLAY_LEVEL = 1
+
+    throttle = None
+    if args.throttle:
+        (count, period) = args.throttle.split('/')
+        throttle = (int(count), float(period))
+
+    directory = tempfile.mkdtemp(prefix='bulkmail-benchmark-')
+    sinks = []
+    try:
+        if not args.skip_send:
+            context = None if args.no_tls else create_tls_context(directory, args.tls_cert, args.tls_key)
+            for i in range(max(1, args.relays) + args.failing_relays):
+                sink = SmtpSink(context, args.latency / 1000, not args.no_auth, i >= max(1, args.relays), throttle)
+                sinks.append(sink)
+                logon = '' if args.no_auth else 'benchmark:benchmark@'
+                settings.MAIL_RELAY.append(f"smtp://{logon}127.0.0.1:{sink.start()}")
+
+        addr_file = os.path.join(directory, 'addresses.csv')
+        write_address_file(addr_file, args.recipients, args.domains)
+
+        print(f"\nBulk Mail benchmark: {args.recipients} recipients, {args.domains} domains, {args.latency:g} ms latency, "
+              f"pipelining {'off' if args.no_pipelining else 'on'}, {max(1, args.relays)} relays ({args.failing_relays} failing)\n")
+        print(f"{'Size KB':>7}  {'Conns':>5}  {'Render/s':>9}  {'Send/s':>8}  {'p50 ms':>7}  {'p95 ms':>7}  {'p99 ms':>7}  {'Change':>8}")
+        print(DASH_LINE)
+        attachments = [bulkmail.Attachment(filename) for filename in args.attach]
+        results = []
+        for size in sizes:
+            message_file = os.path.join(directory, f"message-{size:g}.md")
+            write_message_file(message_file, int(size * 1024))
+            campaign = Campaign(addr_file, message_file, args.markdown_per_recipient, attachments)
+            render = bench_render(campaign)
+            for connections in ([0] if args.skip_send else connection_counts):
+                send = None if args.skip_send else bench_send(campaign, sinks, connections)
+                result = {'size_kb': size, 'connections': connections, 'render': render, 'send': send}
+                results.append(result)
+                previous = baseline.get((size, connections))
+                if previous is None:
+                    delta = ''
+                elif send is None or previous['send'] is None:
+                    delta = change(render['rate'], previous['render']['rate'])
+                else:
+                    delta = change(send['rate'], previous['send']['rate'])
+                if send is None:
+                    print(f"{size:>7g}  {'-':>5}  {render['rate']:>9.1f}  {'-':>8}  {'-':>7}  {'-':>7}  {'-':>7}  {delta:>8}")
+                    continue
+                print(f"{size:>7g}  {connections:>5}  {render['rate']:>9.1f}  {send['rate']:>8.1f}  "
+                      f"{send['p50_ms']:>7.2f}  {send['p95_ms']:>7.2f}  {send['p99_ms']:>7.2f}  {delta:>8}")
+                if send['error'] or send['failures'] or send['received'] != send['messages']:
+                    print(f"         {send['failures']} failures, {send['received']} of {send['messages']} received.  {send['error'] or ''}")
+                if send['throttled']:
+                    print(f"         {send['throttled']} recipients throttled by the sinks.")
+        print()
+
+        if args.output:
+            with open(args.output, 'w', encoding='UTF-8') as f:
+                json.dump({
+                    'version': bulkmail.SCRIPT_VERS,
+                    'recipients': args.recipients,
+                    'domains': args.domains,
+                    'latency_ms': args.latency,
+                    'pipelining': not args.no_pipelining,
+                    'relays': max(1, args.relays),
+                    'failing_relays': args.failing_relays,
+                    'markdown_per_recipient': args.markdown_per_recipient,
+                    'attachments': [os.path.basename(filename) for filename in args.attach],
+                    'results': results,
+                }, f, indent=2)
+    finally:
+        for sink in sinks:
+            sink.stop()
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+##############################################################################
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""
+Shared fixtures for the Bulk Mail tests.  Messages are sent to the local SMTP sink from the
+benchmark script, which uses the openssl command to create a certificate for STARTTLS.
+"""
+
+import os
+import shutil
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import benchmark  # noqa: E402
+import bulkmail  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def settings():
+    """Start each test with settings for sending quietly to the sink, and restore the original
+    settings afterwards.
+
+    Yields:
+        type -- the bulkmail.Settings class
+    """
+    saved = {key: (list(value) if isinstance(value, list) else value) for (key, value) in vars(bulkmail.Settings).items() if key.isupper()}
+    initializing = bulkmail.Writer.INITIALIZING
+    bulkmail.Settings.MAIL_FROM_ADDR = 'Bulk Mail Tests <tests@example.com>'
+    bulkmail.Settings.ADDRESS_TEMPLATE = '{first_name} {last_name} <{email}>'
+    bulkmail.Settings.MAIL_WAIT = 0.0
+    bulkmail.Settings.MAIL_RETRY_DELAY = 0.2
+    bulkmail.Settings.DISPLAY_LEVEL = 0
+    bulkmail.Settings.LOG_LEVEL = 0
+    yield bulkmail.Settings
+    for (key, value) in saved.items():
+        setattr(bulkmail.Settings, key, value)
+    bulkmail.Writer.INITIALIZING = initializing
+
+
+@pytest.fixture(scope='session')
+def tls_context(tmp_path_factory):
+    """Create the server context used by the sinks for STARTTLS.
+
+    Returns:
+        ssl.SSLContext -- the server context
+    """
+    if shutil.which('openssl') is None:
+        pytest.skip("The openssl command is needed to create the sink certificate.")
+    return benchmark.create_tls_context(str(tmp_path_factory.mktemp('tls')))
+
+
+@pytest.fixture
+def start_sink(tls_context):
+    """Start local SMTP sinks, which are stopped at the end of the test.
+
+    Returns:
+        callable -- called with the benchmark.SmtpSink keyword arguments, and tls=False to not
+        offer STARTTLS, to start a sink and return it with its relay setting
+    """
+    sinks = []
+
+    def start(tls=True, latency=0.002, auth=False, **kwargs):
+        sink = benchmark.SmtpSink(tls_context if tls else None, latency, auth, **kwargs)
+        port = sink.start()
+        sinks.append(sink)
+        return (sink, f"smtp://127.0.0.1:{port}")
+
+    yield start
+    for sink in sinks:
+        sink.stop()
+
+
+@pytest.fixture
+def message_file(tmp_path):
+    """Write a small markdown message.
+
+    Returns:
+        str -- the message file name
+    """
+    filename = str(tmp_path / 'message.md')
+    benchmark.write_message_file(filename, 1024)
+    return filename
+
+
+@pytest.fixture
+def send_campaign():
+    """Send a campaign through a send engine using the current settings.
+
+    Returns:
+        callable -- called with the address file, the message file and the number of
+        connections, returning the finished bulkmail.SendEngine
+    """
+    def send(addr_file, message_file, connections=2):
+        campaign = benchmark.Campaign(addr_file, message_file)
+        scheduler = bulkmail.DomainScheduler(
+            bulkmail.Settings.SCHEDULE_WINDOW,
+            bulkmail.Settings.DOMAIN_CONCURRENCY,
+            bulkmail.Settings.DOMAIN_RATE_MINUTE / 60,
+            bulkmail.Settings.DOMAIN_RATE_BURST,
+        )
+        engine = bulkmail.SendEngine(connections, campaign.assembler(), None, bulkmail.RateLimiter.fromSettings(), None, scheduler)
+        engine.start()
+        for (msg_to, msg_text, msg_html) in campaign.messages():
+            if not engine.submit(msg_to, msg_text, msg_html):
+                break
+        engine.finish()
+        return engine
+
+    return send
@@ -0,0 +1,27 @@
+"""
+Tests of the selection of the rows in the address file for each part of a sharded campaign.
+"""
+
+import bulkmail
+
+
+def test_shard_rows_reports_row_missing_field(settings, tmp_path, capsys):
+    """A row missing a field used in the address template is reported as invalid by a single
+    shard rather than stopping the campaign.
+    """
+    settings.DISPLAY_LEVEL = 1
+    addr_file = tmp_path / 'addresses.csv'
+    rows = [f"First{i},Last{i},user{i}@example.com" for i in range(20)]
+    rows.insert(5, "Short,Row")
+    addr_file.write_text("first_name,last_name,email\n" + "\n".join(rows) + "\n", encoding='UTF-8')
+    (addr_rows, addr_fields) = bulkmail.parse_address_file(str(addr_file), [])
+    addr_template = bulkmail.Template(settings.ADDRESS_TEMPLATE, addr_fields)
+
+    selected = {}
+    for number in (1, 2, 3):
+        shard = bulkmail.Shard(number, 3)
+        addr_rows = bulkmail.parse_address_file(str(addr_file), addr_template.fields)[0]
+        selected[number] = [row_number for (row_number, address_line) in bulkmail.shard_rows(addr_rows, addr_template, shard, {2})]
+
+    assert sorted(row for rows in selected.values() for row in rows) == [1, 3, 4, 5] + list(range(7, 22))
+    assert capsys.readouterr().out.count("Row 6: Invalid address") == 1
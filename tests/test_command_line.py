@@ -0,0 +1,26 @@
+"""
+Tests of the settings read from the configuration file and the command line.
+"""
+
+import pytest
+
+import bulkmail
+
+
+@pytest.mark.parametrize(('key', 'option'), [
+    ('SEND_REPLY', '--no-reply'),
+    ('NO_CONFIRM', '--confirm'),
+    ('NO_FOOTER', '--footer'),
+    ('MAIL_PIPELINING', '--no-pipelining'),
+    ('MARKDOWN_PER_RECIPIENT', '--no-markdown-per-recipient'),
+    ('DISPLAY_RECIPIENTS', '--no-recipients'),
+])
+def test_on_off_options_keep_config_file_setting(settings, tmp_path, key, option):
+    """A setting turned on in the configuration file is only turned off by using the option."""
+    config_file = tmp_path / 'test.cfg'
+    config_file.write_text(f"{key} = True\n", encoding='UTF-8')
+    for (argv, expected) in (([], True), ([option], False)):
+        for (name, value) in bulkmail.read_config_file(str(config_file)):
+            bulkmail.updateSetting(name, value, True)
+        bulkmail.apply_command_line(bulkmail.parse_command_line(['-c', 'check'] + argv))
+        assert getattr(settings, key) is expected
@@ -0,0 +1,62 @@
+"""
+Tests of the campaign jobs sent by the spool daemon.
+"""
+
+import threading
+import time
+
+import benchmark
+import bulkmail
+
+
+def wait_for(path, timeout=30.0):
+    """Wait for a file to be created.
+
+    Arguments:
+        path {pathlib.Path} -- the file
+
+    Keyword Arguments:
+        timeout {float} -- the maximum number of seconds to wait (default: 30.0)
+
+    Returns:
+        bool -- True if the file was created
+    """
+    end = time.monotonic() + timeout
+    while not path.exists():
+        if time.monotonic() > end:
+            return False
+        time.sleep(0.05)
+    return True
+
+
+def test_job_settings_are_not_used_for_later_jobs(settings, start_sink, tmp_path):
+    """The attachment and footer setting of one job aren't used for the next job."""
+    (sink, relay) = start_sink(keep=True)
+    settings.MAIL_RELAY = [relay]
+    spool_dir = tmp_path / 'spool'
+    spool_dir.mkdir()
+    benchmark.write_address_file(str(spool_dir / 'addresses.csv'), 4, 2)
+    benchmark.write_message_file(str(spool_dir / 'message.md'), 256)
+    (spool_dir / 'secret.txt').write_text("Only for the first job.\n", encoding='UTF-8')
+    daemon = bulkmail.SpoolDaemon(str(spool_dir), 1)
+    thread = threading.Thread(target=daemon.run, args=(0.05,), daemon=True)
+    thread.start()
+    try:
+        jobs = (
+            ('first', "MAIL_ATTACHMENT = secret.txt\nNO_FOOTER = True\n"),
+            ('second', ""),
+        )
+        data = {}
+        for (name, extra) in jobs:
+            (spool_dir / f"{name}.job").write_text(
+                f"MAIL_ADDRESS_FILE = addresses.csv\nMAIL_MESSAGE_FILE = message.md\n{extra}", encoding='UTF-8'
+            )
+            assert wait_for(spool_dir / f"{name}.done")
+            data[name] = [message.decode('UTF-8', 'replace') for message in sink.data]
+            sink.reset()
+    finally:
+        daemon.stop()
+        thread.join(30)
+    assert [len(messages) for messages in data.values()] == [4, 4]
+    assert all('secret.txt' in message and 'Sent using the Python' not in message for message in data['first'])
+    assert all('secret.txt' not in message and 'Sent using the Python' in message for message in data['second'])
@@ -0,0 +1,59 @@
+"""
+Tests of sending messages from another program using BulkMailer.
+"""
+
+import pytest
+
+import benchmark
+import bulkmail
+
+
+@pytest.fixture
+def addr_file(tmp_path):
+    """Write an address file with ten recipients.
+
+    Returns:
+        str -- the address file name
+    """
+    filename = str(tmp_path / 'addresses.csv')
+    benchmark.write_address_file(filename, 10, 2)
+    return filename
+
+
+def test_mailers_keep_their_own_settings(start_sink, addr_file, message_file):
+    """The messages of a mailer are sent with its own settings while another mailer with
+    different settings sets up a batch.
+    """
+    (sink_a, relay_a) = start_sink(latency=0.02)
+    (sink_b, relay_b) = start_sink()
+    with bulkmail.BulkMailer(MAIL_RELAY=relay_a, MAIL_FROM_ADDR='A <a@example.com>', MAIL_CONNECTIONS=1) as mailer_a, \
+            bulkmail.BulkMailer(MAIL_RELAY=relay_b, MAIL_FROM_ADDR='B <b@example.com>', MAIL_CONNECTIONS=2) as mailer_b:
+        results_a = mailer_a.send(addr_file, message_file)
+        first = next(results_a)
+        results_b = list(mailer_b.send(addr_file, message_file))
+        results_a = [first] + list(results_a)
+    assert not any(result.failed for result in results_a + results_b)
+    assert sink_a.senders == {'<a@example.com>': 10}
+    assert sink_b.senders == {'<b@example.com>': 10}
+
+
+def test_mailer_numbers_each_batch(settings, start_sink, addr_file, message_file, capsys):
+    """The messages of each batch sent by a mailer are numbered from one."""
+    (sink, relay) = start_sink()
+    with bulkmail.BulkMailer(MAIL_RELAY=relay, DISPLAY_LEVEL=2) as mailer:
+        for batch in range(2):
+            assert len(list(mailer.send(addr_file, message_file))) == 10
+    lines = capsys.readouterr().out.splitlines()
+    assert len([line for line in lines if line.startswith('Sending mail to')]) == 2
+    assert len([line for line in lines if line.startswith('    1.  ')]) == 2
+    assert not [line for line in lines if line.startswith('   11.  ')]
+
+
+def test_log_file_error_raises(settings, tmp_path):
+    """An error writing to the log file raises BulkMailError rather than exiting."""
+    settings.LOG_LEVEL = 1
+    settings.LOG_FILE = str(tmp_path)
+    bulkmail.Writer.INITIALIZING = False
+    with pytest.raises(bulkmail.BulkMailError) as error:
+        bulkmail.Writer.Log(1, "Test entry")
+    assert error.value.number == 118
@@ -0,0 +1,130 @@
+"""
+Tests of the scheduling and pacing of messages and the handling of failing mail servers.
+"""
+
+import time
+
+import benchmark
+
+
+def longest_run(domains):
+    """Find the longest run of consecutive recipients in the same domain.
+
+    Arguments:
+        domains {list} -- the domain of each recipient, in the order received
+
+    Returns:
+        int -- the length of the longest run
+    """
+    longest = 0
+    run = 0
+    previous = None
+    for domain in domains:
+        run = run + 1 if domain == previous else 1
+        previous = domain
+        longest = max(longest, run)
+    return longest
+
+
+def test_domain_limits(settings, start_sink, send_campaign, message_file, tmp_path):
+    """An address file sorted by domain is interleaved, and the per-domain concurrency and rate
+    limits are kept, so that a sink throttling each domain just above the limits accepts every
+    recipient.
+    """
+    (count, period) = (5, 1.0)
+    (recipients, domains, concurrency) = (40, 4, 2)
+    (sink, relay) = start_sink(throttle=(count, period))
+    settings.MAIL_RELAY = [relay]
+    settings.DOMAIN_CONCURRENCY = concurrency
+    # A token bucket allows the burst plus the rate over any period
+    settings.DOMAIN_RATE_MINUTE = (count - 1) * 60 / period
+    settings.DOMAIN_RATE_BURST = 1
+    addr_file = str(tmp_path / 'sorted.csv')
+    benchmark.write_address_file(addr_file, recipients, domains, sort=True)
+
+    engine = send_campaign(addr_file, message_file, 8)
+
+    assert engine.error is None
+    assert (engine.count, engine.count_err, sink.messages) == (recipients, 0, recipients)
+    assert sink.throttled == 0
+    assert max(sink.max_inflight.values()) <= concurrency
+    times = {}
+    for (domain, received) in sink.received:
+        times.setdefault(domain, []).append(received)
+    for received in times.values():
+        busiest = max(sum(1 for t in received[i:] if t - start < period) for (i, start) in enumerate(received))
+        assert busiest <= count
+    order = [domain for (domain, received) in sink.received]
+    assert longest_run(order[:len(order) // 2]) <= concurrency
+
+
+def test_relay_failover(settings, start_sink, send_campaign, message_file, tmp_path):
+    """A relay that refuses every connection is marked unhealthy after RELAY_FAILURE_LIMIT
+    failures, its messages are sent through the working relay, and it is checked again once
+    after each cool-down period.
+    """
+    (recipients, limit, cooldown) = (60, 2, 1.0)
+    (working, working_relay) = start_sink()
+    (failing, failing_relay) = start_sink(failing=True)
+    settings.MAIL_RELAY = [working_relay, failing_relay]
+    settings.RELAY_FAILURE_LIMIT = limit
+    settings.RELAY_COOLDOWN = cooldown
+    # Spread the messages over a few cool-down periods
+    settings.MAIL_RATE_SECOND = recipients / (cooldown * 3.5)
+    settings.MAIL_RATE_BURST = 1
+    addr_file = str(tmp_path / 'failover.csv')
+    benchmark.write_address_file(addr_file, recipients, 10)
+
+    engine = send_campaign(addr_file, message_file, 2)
+
+    assert engine.error is None
+    assert (engine.count_err, working.messages) == (0, recipients)
+    assert engine.relays[1].count_down >= 1
+    assert engine.count_retry > 0
+    # The connections made by each worker before the relay is marked unhealthy may overlap,
+    # but after that there is a single check at the end of each cool-down period
+    times = failing.connection_times
+    checks = [t for t in times if t - times[0] >= cooldown * 0.9]
+    assert checks
+    assert len(times) - len(checks) <= limit + 1
+    for (previous, current) in zip(checks, checks[1:]):
+        assert current - previous >= cooldown * 0.9
+
+
+def test_server_without_starttls(settings, start_sink, send_campaign, message_file, tmp_path):
+    """Sending stops with error 129 for a mail server that doesn't offer STARTTLS, without
+    sending any messages or retrying the server as a failing relay.
+    """
+    (sink, relay) = start_sink(tls=False)
+    settings.MAIL_RELAY = [relay]
+    addr_file = str(tmp_path / 'no-tls.csv')
+    benchmark.write_address_file(addr_file, 10, 2)
+
+    engine = send_campaign(addr_file, message_file, 2)
+
+    assert engine.error_number == 129
+    assert sink.messages == 0
+    assert engine.count_retry == 0
+    assert engine.relays[0].disabled
+
+
+def test_wait_applies_to_each_connection(settings, start_sink, send_campaign, message_file, tmp_path):
+    """The wait between messages applies separately to each connection, so more connections
+    send the messages faster.
+    """
+    (recipients, connections, wait) = (8, 2, 0.5)
+    (sink, relay) = start_sink()
+    settings.MAIL_RELAY = [relay]
+    settings.MAIL_WAIT = wait
+    addr_file = str(tmp_path / 'wait.csv')
+    benchmark.write_address_file(addr_file, recipients, 4)
+
+    start = time.monotonic()
+    engine = send_campaign(addr_file, message_file, connections)
+    elapsed = time.monotonic() - start
+
+    assert engine.error is None
+    assert sink.messages == recipients
+    # Each connection waits between its own messages
+    minimum = (recipients // connections - 1) * wait
+    assert minimum * 0.9 <= elapsed < minimum + wait * 2
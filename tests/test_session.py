@@ -0,0 +1,72 @@
+"""
+Tests of the handling of the mail server replies and envelope addresses by the mail sessions.
+"""
+
+import smtplib
+
+import pytest
+
+import benchmark
+import bulkmail
+
+
+@pytest.fixture
+def utf8_addr_file(tmp_path):
+    """Write an address file with one recipient whose address has non-ASCII characters.
+
+    Returns:
+        str -- the address file name
+    """
+    filename = tmp_path / 'utf8.csv'
+    rows = [f"First{i},Last{i},user{i}@example.com" for i in range(4)]
+    rows.insert(2, "José,Núñez,josé@example.com")
+    filename.write_text("first_name,last_name,email\n" + "\n".join(rows) + "\n", encoding='UTF-8')
+    return str(filename)
+
+
+def test_closing_connection_resends_messages(settings, start_sink, send_campaign, message_file, tmp_path):
+    """A 421 reply in the middle of a pipelined group is handled as a lost connection, so the
+    message is sent again on a new connection.
+    """
+    (recipients, closing) = (10, 3)
+    (sink, relay) = start_sink(closing=closing)
+    settings.MAIL_RELAY = [relay]
+    settings.MAIL_RECONNECTS = 1
+    addr_file = str(tmp_path / 'closing.csv')
+    benchmark.write_address_file(addr_file, recipients, 2)
+
+    engine = send_campaign(addr_file, message_file, 1)
+
+    assert engine.error is None
+    assert (engine.count, engine.count_err, engine.count_retry) == (recipients, 0, 0)
+    assert sink.messages == recipients
+    assert sink.connections == -(-recipients // closing)
+
+
+@pytest.mark.parametrize('pipelining', [True, False])
+def test_non_ascii_address_without_smtputf8(settings, start_sink, utf8_addr_file, message_file, pipelining):
+    """A recipient address with non-ASCII characters is refused without sending it to a mail
+    server that doesn't support SMTPUTF8, and the other recipients are sent the message.
+    """
+    (sink, relay) = start_sink(utf8=False)
+    with bulkmail.BulkMailer(MAIL_RELAY=relay, MAIL_PIPELINING=pipelining) as mailer:
+        results = list(mailer.send(utf8_addr_file, message_file))
+    failed = [result for result in results if result.failed]
+    assert len(results) == 5
+    assert [result.msg_to for result in failed] == ['José Núñez <josé@example.com>']
+    assert isinstance(failed[0].error, smtplib.SMTPRecipientsRefused)
+    assert [code for (code, resp) in failed[0].error.recipients.values()] == [553]
+    assert sink.messages == 4
+
+
+@pytest.mark.parametrize('pipelining', [True, False])
+def test_non_ascii_address_with_smtputf8(settings, start_sink, utf8_addr_file, message_file, pipelining):
+    """A recipient address with non-ASCII characters is sent to a mail server that supports
+    SMTPUTF8.
+    """
+    (sink, relay) = start_sink()
+    with bulkmail.BulkMailer(MAIL_RELAY=relay, MAIL_PIPELINING=pipelining) as mailer:
+        results = list(mailer.send(utf8_addr_file, message_file))
+    assert len(results) == 5
+    assert not [result for result in results if result.failed]
+    assert sink.messages == 5